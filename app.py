@@ -1,21 +1,29 @@
 import streamlit as st
 import os
+import io
 import time
+import hashlib
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
 
 from scripts.vision_client import analyze_image
-from scripts.retriever import retrieve_poems, get_embedding
+from scripts.retriever import retrieve_poems_batch, fetch_vectors, warm_up
 from scripts.generator import generate_poem
+from scripts.titles import clean_title
 
 # Safe Import for Modules
 try:
     from scripts.visualizer import LatentSpaceVisualizer
     from scripts.audio import AudioEngine
+    from scripts.universe_projection import load_or_build_projection
     MODULES_AVAILABLE = True
 except ImportError:
     MODULES_AVAILABLE = False
 
 # --- Config ---
+DEFAULT_TEMPERATURE = 0.5
+
 st.set_page_config(layout="wide", page_title="Poetic Camera")
 
 st.markdown("""
@@ -30,28 +38,221 @@ st.markdown("""
 
 # --- CACHING FUNCTIONS ---
 @st.cache_data(show_spinner=False)
-def run_vision_cached(image_file):
+def run_vision_cached(_image_bytes, hash_key):
+    # Keyed on the content digest only; the leading underscore stops Streamlit hashing the bytes again
     try:
-        with open("temp_input.jpg", "wb") as f:
-            f.write(image_file.getbuffer())
-        return analyze_image("temp_input.jpg")
+        return analyze_image(io.BytesIO(_image_bytes))
     except Exception as e:
         return f"Error: {e}"
 
 @st.cache_data(show_spinner=False)
-def load_universe_vectors():
-    print("[SYSTEM] Cache Miss: Fetching Background Universe vectors...")
+def get_image_size(_image_bytes, hash_key):
+    # Image.open only parses the header; .size never triggers a pixel decode
+    with Image.open(io.BytesIO(_image_bytes)) as img:
+        return img.size
+
+@st.cache_resource(show_spinner=False)
+def load_universe_projection():
+    # The background universe is a fixed asset: its PCA is fitted once and served from disk
+    projection = load_or_build_projection()
+    if projection is None:
+        raise RuntimeError("not enough Universe vectors")  # raise so a failure is never cached
+    return projection
+
+def fetch_universe_projection():
+    try:
+        return load_universe_projection()
+    except Exception as e:
+        print(f"[ERROR] Universe projection unavailable: {e}")
+        return None
+
+@st.cache_resource(show_spinner=False)
+def get_visualizer(universe_key, _projection):
+    # Stateful projector: built once per Universe. Keyed on a digest of the embedded
+    # Universe, so the (unhashed) projection is never mixed up with an earlier one.
+    return LatentSpaceVisualizer(projection=_projection)
+
+@st.cache_data(show_spinner=False)
+def build_latent_fig(query_key, items_key, universe_key, _query_vector, _retrieved_items, _projection):
+    # Only the cheap keys are hashed; the figure is rebuilt only when the query or matches change
+    # Searches skip match vectors, so fetch them here, on a cache miss of an opted-in plot
+    values = fetch_vectors([m['id'] for m in _retrieved_items])
+    if len(values) < len(_retrieved_items):
+        raise RuntimeError("match vectors unavailable")  # raise so a partial plot is never cached
+    memories = [
+        {"values": values[m['id']], "metadata": m.get('metadata', {})}
+        for m in _retrieved_items if m['id'] in values
+    ]
+    viz = get_visualizer(universe_key, _projection)
+    return viz.visualize_query_context(_query_vector, memories)
+
+def build_context_entries(retrieved_items):
+    # Normalize once at retrieval time so the Context Data loop is plain tuple unpacking
+    entries = []
+    for i, m in enumerate(retrieved_items):
+        meta = m.get('metadata', {})
+        clean_text = meta.get('text', "No text.").strip()
+
+        # Indexed poems carry a precomputed display_title; older entries are cleaned here
+        title = meta.get('display_title') or clean_title(meta.get('title', f"{i+1}"))
+        entries.append((title, clean_text))
+    return entries
+
+@st.cache_resource(show_spinner=False)
+def get_audio_engine():
+    # One engine serves every rerun and session
+    return AudioEngine()
+
+@st.cache_data(show_spinner=False, max_entries=128, ttl=24 * 3600)
+def synthesize_cached(text, voice):
+    # Keyed on (poem, voice): identical poems replay instantly, across sessions too
+    audio_bytes = get_audio_engine().synthesize(text)
+    if audio_bytes is None:
+        raise RuntimeError("TTS failed")  # raise so a failure is never cached
+    return audio_bytes
+
+def synthesize_audio(text):
+    engine = get_audio_engine()
     try:
-        results = retrieve_poems("Life Death Eternity Nature Soul Love Time", top_k=50)
-        return [item['values'] for item in results if 'values' in item]
-    except Exception:
-        return []
+        return synthesize_cached(text, f"{engine.lang}-{engine.tld}")
+    except RuntimeError:
+        return None
+
+# Every session on the worker shares these pools. All jobs are network-bound, so
+# threads are cheap; size for concurrent sessions, not cores.
+MAX_CONCURRENT_SESSIONS = 8
+
+@st.cache_resource(show_spinner=False)
+def get_executor():
+    # Background work: warm-up, Universe loads and one speculative draft per upload
+    return ThreadPoolExecutor(max_workers=2 * MAX_CONCURRENT_SESSIONS, thread_name_prefix="background")
+
+@st.cache_resource(show_spinner=False)
+def get_tts_executor():
+    # TTS runs after a click and the user waits on it, so it never queues behind
+    # other sessions' speculative drafts
+    return ThreadPoolExecutor(max_workers=MAX_CONCURRENT_SESSIONS, thread_name_prefix="tts")
+
+@st.cache_resource(show_spinner=False)
+def warm_up_connections():
+    # Once per process, in the background so it never delays the first paint
+    return get_executor().submit(warm_up)
+
+warm_up_connections()
+
+# --- FRAGMENTS ---
+# Widgets inside a fragment only rerun their own block, so slider ticks and the
+# generate button skip the CSS, sidebar, image card and visualizer entirely.
+@st.fragment
+def generation_parameters():
+    st.markdown("#### Parameters")
+    st.slider("Model creative freedom", 0.1, 1.0, DEFAULT_TEMPERATURE, key="temperature")
+    
+    with st.expander("Context Data"):
+        for title, clean_text in st.session_state.app["context_entries"]:
+            st.markdown(f"**{title}**")
+            st.caption(f"{clean_text}") 
+            st.divider()
+
+@st.fragment
+def latent_space_panel():
+    # Opt-in: the Plotly build (and the universe fetch) only happen when asked for
+    if not st.toggle("Show latent space", value=False, key="show_viz"):
+        return
+
+    st.caption("Latent Space Visualization")
+
+    if st.session_state.app["universe_future"] is None:
+        st.session_state.app["universe_future"] = get_executor().submit(fetch_universe_projection)
+    projection = st.session_state.app["universe_future"].result()
+    if projection is None:
+        # Plot without the background this time; the next rerun retries the load
+        st.session_state.app["universe_future"] = None
+    universe_key = "" if projection is None else hashlib.sha1(projection["universe_3d"].tobytes()).hexdigest()
+    query_vector = st.session_state.app["query_vector"]
+    items = st.session_state.app["retrieved_items"]
+    
+    try:
+        fig = build_latent_fig(
+            np.asarray(query_vector, dtype=np.float32).tobytes(),
+            "|".join(m['id'] for m in items),
+            universe_key,
+            query_vector,
+            items,
+            projection
+        )
+    except RuntimeError as e:
+        print(f"[ERROR] Latent space plot unavailable: {e}")
+        st.caption("Latent space unavailable right now; it will retry on the next run.")
+        return
+    if fig:
+        st.plotly_chart(fig, use_container_width=True)
+
+@st.fragment
+def generation_sequence():
+    temperature = st.session_state.get("temperature", DEFAULT_TEMPERATURE)
+
+    if st.button("Generate poem with voice", type="primary", use_container_width=True):
+
+#TEXT GENERATION
+        with st.status("Drafting Poem...", expanded=True) as status:
+            st.write("Task: Text Inference (Llama 3 on Groq)")
+
+            # The speculative draft serves at most one click: take it out of state so later
+            # clicks draft a fresh poem (and never touch a cancelled future)
+            poem_future = st.session_state.app["poem_future"]
+            st.session_state.app["poem_future"] = None
+            if (poem_future is not None and not poem_future.cancelled()
+                    and temperature == DEFAULT_TEMPERATURE):
+                # Speculative draft matches the requested settings (likely already finished)
+                st.session_state.app["generated_poem"] = poem_future.result()
+            else:
+                if poem_future is not None:
+                    poem_future.cancel()
+                st.session_state.app["generated_poem"] = generate_poem(
+                    st.session_state.app["narrative"],
+                    st.session_state.app["retrieved_items"],
+                    temperature=temperature
+                )
+            # Clean once at generation time; reruns render the stored string
+            if st.session_state.app["generated_poem"]:
+                st.session_state.app["generated_poem_rendered"] = st.session_state.app["generated_poem"].replace("- ", "— ")
+            status.update(label="Poem Drafted!", state="complete", expanded=False)
+
+        # Start TTS in the background before rendering so synthesis overlaps the text paint
+        tts_future = None
+        if MODULES_AVAILABLE and st.session_state.app["generated_poem"]:
+            tts_future = get_tts_executor().submit(synthesize_audio, st.session_state.app["generated_poem"])
+
+#IMMEDIATE RENDER
+        if st.session_state.app["generated_poem"]:
+            st.markdown(
+                f"<div style='text-align: center; font-style: italic; padding: 10px; font-family: serif;'>{st.session_state.app['generated_poem_rendered']}</div>", 
+                unsafe_allow_html=True
+            )
+
+#AUDIO GENERATION (Background Task)
+        if tts_future is not None:
+        # Create a placeholder for the audio player so it pops in later
+            audio_placeholder = st.empty()
+            with audio_placeholder.status("Synthesizing Audio...", expanded=False) as audio_status:
+            # 2. Collect Audio (already running since the poem returned)
+                st.session_state.app["audio_bytes"] = tts_future.result()
+                audio_status.update(label="Audio Ready", state="complete")
+
+#Replace the status spinner with the actual Audio Player
+            if st.session_state.app["audio_bytes"]:
+                audio_placeholder.audio(st.session_state.app["audio_bytes"], format="audio/mpeg")
 
 # --- Session State ---
-keys = ['narrative', 'retrieved_items', 'generated_poem', 'audio_bytes', 'last_upload_id', 'query_vector']
-for k in keys:
-    if k not in st.session_state:
-        st.session_state[k] = None
+# All pipeline state lives in one namespaced dict: one lookup per rerun, O(1) reset
+keys = ['narrative', 'retrieved_items', 'generated_poem', 'audio_bytes', 'last_upload_id', 'query_vector', 'universe_future', 'poem_future', 'context_entries', 'generated_poem_rendered']
+
+def new_app_state():
+    return {k: None for k in keys}
+
+if "app" not in st.session_state:
+    st.session_state.app = new_app_state()
 
 # ==========================================
 # 1. SIDEBAR (Controls Only)
@@ -75,7 +276,7 @@ with st.sidebar:
     st.markdown("---")
     if st.button("System Reset"):
         st.cache_data.clear()
-        for k in keys: st.session_state[k] = None
+        st.session_state.app = new_app_state()
         st.rerun()
 
 # ==========================================
@@ -92,7 +293,7 @@ if input_method == "Upload":
     image_source = sidebar_upload
 elif input_method == "Camera":
     # --- CAMERA IN MAIN AREA ---
-    with st.expander("Open Viewfinder", expanded=(st.session_state.last_upload_id is None)):
+    with st.expander("Open Viewfinder", expanded=(st.session_state.app["last_upload_id"] is None)):
         camera_shot = st.camera_input("Capture Scene")
         if camera_shot:
             image_source = camera_shot
@@ -101,14 +302,18 @@ elif input_method == "Camera":
 if image_source:
     
     # Check for new file
-    file_id = f"{image_source.name}_{image_source.size}"
-    if st.session_state.last_upload_id != file_id:
-        st.session_state.narrative = None
-        st.session_state.retrieved_items = None
-        st.session_state.generated_poem = None
-        st.session_state.query_vector = None 
-        st.session_state.audio_bytes = None 
-        st.session_state.last_upload_id = file_id
+    image_bytes = image_source.getvalue()
+    file_id = hashlib.sha256(image_bytes).hexdigest()
+    if st.session_state.app["last_upload_id"] != file_id:
+        # Single dict swap; the universe projection is image-independent, so keep it
+        fresh = new_app_state()
+        fresh["universe_future"] = st.session_state.app["universe_future"]
+        fresh["last_upload_id"] = file_id
+        st.session_state.app = fresh
+
+    # Kick off the universe fetch now so it overlaps with vision latency (only if the plot is wanted)
+    if MODULES_AVAILABLE and st.session_state.get("show_viz") and st.session_state.app["universe_future"] is None:
+        st.session_state.app["universe_future"] = get_executor().submit(fetch_universe_projection)
 
     # Layout
     col1, col2, col3 = st.columns([1, 1, 1], gap="medium")
@@ -119,11 +324,11 @@ if image_source:
             st.subheader("I. Ingestion")
             
             # Display Image without stretching it
-            st.image(image_source, use_container_width=True)
+            st.image(image_bytes, use_container_width=True)
             
             #Show actual resolution to verify the fix
-            img = Image.open(image_source)
-            st.caption(f"Res: {img.size[0]} x {img.size[1]} px")
+            width, height = get_image_size(image_bytes, file_id)
+            st.caption(f"Res: {width} x {height} px")
 
     # --- CARD 2: INTERNAL MONOLOGUE ---
     with col2:
@@ -131,113 +336,62 @@ if image_source:
             st.subheader("II. Processing")
             
             #Vision Analysis
-            if not st.session_state.narrative:
+            if not st.session_state.app["narrative"]:
                 with st.status("[SYSTEM] Initializing Vision Pipeline...", expanded=True) as s:
                     st.write("Task: Image Analysis (Llama 3.2 Vision)")
                     # Capture the result
-                    result = run_vision_cached(image_source) 
-                    st.session_state.narrative = result
+                    result = run_vision_cached(image_bytes, file_id)
+                    st.session_state.app["narrative"] = result
                     s.update(label="[SYSTEM] Vision Analysis: Complete", state="complete", expanded=False)
             
             # --- ERROR HANDLING & RETRIEVAL ---
-            if not st.session_state.narrative:
+            if not st.session_state.app["narrative"]:
                 st.error("Vision Analysis returned no data. Check logs.")
             
             #Check for explicit error
-            elif st.session_state.narrative.startswith("ERROR:") or "Error:" in st.session_state.narrative:
-                st.error(f"Pipeline Failed: {st.session_state.narrative}")
+            elif st.session_state.app["narrative"].startswith("ERROR:") or "Error:" in st.session_state.app["narrative"]:
+                st.error(f"Pipeline Failed: {st.session_state.app['narrative']}")
                 st.stop() 
             
             #Proceed if valid
             else:
-                st.info(f"**Narrative:** {st.session_state.narrative}")
+                st.info(f"**Narrative:** {st.session_state.app['narrative']}")
 
                 #Memory Retrieval
-                if not st.session_state.retrieved_items:
+                if not st.session_state.app["retrieved_items"]:
                     with st.spinner("Task: Vector Search (Pinecone)..."):
-                        
-                        st.session_state.retrieved_items = retrieve_poems(st.session_state.narrative)
-                        st.session_state.query_vector = get_embedding(st.session_state.narrative)
+                        # One embedding call serves both the search and the visualizer
+                        [(query_vector, matches)] = retrieve_poems_batch([st.session_state.app["narrative"]])
+                        st.session_state.app["retrieved_items"] = matches
+                        st.session_state.app["query_vector"] = query_vector
+                        st.session_state.app["context_entries"] = build_context_entries(matches)
+
+                    # Speculatively draft at the default temperature while the user reads the context.
+                    # Submitted before the latent-space panel so the Groq call overlaps the vector
+                    # fetch and projection instead of waiting behind them.
+                    if matches:
+                        st.session_state.app["poem_future"] = get_executor().submit(
+                            generate_poem,
+                            st.session_state.app["narrative"],
+                            matches,
+                            temperature=DEFAULT_TEMPERATURE
+                        )
 
             #Visualization (Stays outside the retrieval block)
-            if st.session_state.retrieved_items and MODULES_AVAILABLE:
+            if st.session_state.app["retrieved_items"] and MODULES_AVAILABLE:
                 st.write("---")
-                st.caption("Latent Space Visualization")
-                
-                universe = load_universe_vectors()
-                viz = LatentSpaceVisualizer(background_vectors=universe)
-                
-                fig = viz.visualize_query_context(
-                    st.session_state.query_vector, 
-                    st.session_state.retrieved_items
-                )
-                if fig:
-                    st.plotly_chart(fig, use_container_width=True)
+                latent_space_panel()
 
     # --- CARD 3: GENERATIVE INFERENCE ---
     with col3:
         with st.container(border=True):
             st.subheader("III. Output")
             
-            if st.session_state.retrieved_items:
-                
-                st.markdown("#### Parameters")
-                temperature = st.slider("Model creative freedom", 0.1, 1.0, 0.5)
-                
-                with st.expander("Context Data"):
-                    for i, m in enumerate(st.session_state.retrieved_items):
-                        meta = m.get('metadata', {})
-                        raw_title = meta.get('title', f"{i+1}")
-                        clean_text = meta.get('text', "No text.").strip()
-
-                        clean_title = raw_title
-
-                        if "poem poem" in clean_title.lower():
-                            clean_title = clean_title.lower().replace("poem poem", "Poem").title()
-
-                        clean_title = clean_title.replace("_", " ").title()
-
+            if st.session_state.app["retrieved_items"]:
+                generation_parameters()
 
-                        st.markdown(f"**{clean_title}**")
-                        st.caption(f"{clean_text}") 
-                        st.divider()
 
-
-    if st.button("Generate poem with voice", type="primary", use_container_width=True):
-    
-#TEXT GENERATION
-        with st.status("Drafting Poem...", expanded=True) as status:
-            st.write("Task: Text Inference (Llama-3-70b)")
-        
-            st.session_state.generated_poem = generate_poem(
-                st.session_state.narrative,
-                st.session_state.retrieved_items,
-                temperature=temperature
-            )
-            status.update(label="Poem Drafted!", state="complete", expanded=False)
-
-#IMMEDIATE RENDER
-        if st.session_state.generated_poem:
-            clean_poem = st.session_state.generated_poem.replace("- ", "— ")
-        
-            st.markdown(
-                f"<div style='text-align: center; font-style: italic; padding: 10px; font-family: serif;'>{clean_poem}</div>", 
-                unsafe_allow_html=True
-            )
-
-#AUDIO GENERATION (Background Task)
-        if MODULES_AVAILABLE and st.session_state.generated_poem:
-        # Create a placeholder for the audio player so it pops in later
-            audio_placeholder = st.empty()
-            with audio_placeholder.status("Synthesizing Audio...", expanded=False) as audio_status:
-            # 2. Generate Audio
-                audio = AudioEngine()
-                st.session_state.audio_bytes = audio.synthesize(st.session_state.generated_poem)
-                audio_status.update(label="Audio Ready", state="complete")
-        
-#Replace the status spinner with the actual Audio Player
-            if st.session_state.audio_bytes:
-                audio_placeholder.audio(st.session_state.audio_bytes, format="audio/mpeg")
+    generation_sequence()
 
 else:
     st.info("System Idle: Select 'Camera' or 'Upload' to begin.")
@@ -34,12 +34,10 @@ class AudioEngine:
             buffer = io.BytesIO()
             
             # Write audio data to the buffer
+            # (BytesIO grows geometrically, so chunked writes stay O(n) — no bytes += concat)
             tts.write_to_fp(buffer)
             
-            # Rewind the buffer to the beginning so it can be read
-            buffer.seek(0)
-            
-            # Get the raw bytes
+            # Get the raw bytes (getvalue reads the whole buffer; no rewind needed)
             audio_bytes = buffer.getvalue()
             
             print(f"[SYSTEM] gTTS Complete. Size: {len(audio_bytes)} bytes.")
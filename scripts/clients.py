@@ -0,0 +1,92 @@
+import os
+import random
+import threading
+import time
+from functools import lru_cache
+from typing import Any, Dict
+
+import httpx
+import orjson
+import google.generativeai as genai
+from dotenv import load_dotenv
+from groq import Groq
+from pinecone.grpc import PineconeGRPC as Pinecone
+
+# Optional: HTTP/2 for httpx (multiplexes concurrent sessions over one connection)
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+load_dotenv()
+
+PINECONE_INDEX_NAME = "poetic-camera"
+GROQ_CHAT_URL = "https://api.groq.com/openai/v1/chat/completions"
+GROQ_MAX_RETRIES = 3
+
+# One keep-alive pool to api.groq.com shared by the vision and generation steps,
+# so the second call of a run reuses the first call's TCP+TLS connection.
+HTTP_MAX_CONNECTIONS = 10
+HTTP_LIMITS = httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=4)
+HTTP_TIMEOUT = httpx.Timeout(60.0, connect=5.0)
+
+# Never admit more requests than the pool has connections: excess callers wait on
+# the semaphore (no deadline) instead of in httpx's pool, where they'd hit PoolTimeout
+GROQ_MAX_IN_FLIGHT = HTTP_MAX_CONNECTIONS
+_groq_slots = threading.BoundedSemaphore(GROQ_MAX_IN_FLIGHT)
+
+# Process-wide singletons, created on first use. Streamlit keeps imported modules
+# across reruns, so every session on a worker shares these connections.
+@lru_cache(maxsize=None)
+def get_http_client() -> httpx.Client:
+    return httpx.Client(http2=HTTP2_AVAILABLE, limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT)
+
+@lru_cache(maxsize=None)
+def get_groq_client() -> Groq:
+    return Groq(api_key=os.getenv("GROQ_API_KEY"), http_client=get_http_client())
+
+def _retry_delay(response: httpx.Response, attempt: int) -> float:
+    # Honour Retry-After when Groq sends one, else exponential backoff with jitter
+    try:
+        return float(response.headers["retry-after"])
+    except (KeyError, ValueError):
+        return 2 ** attempt + random.random()
+
+def groq_chat(payload: Dict[str, Any], max_retries: int = GROQ_MAX_RETRIES) -> str:
+    """
+    POSTs a chat completion straight to Groq's OpenAI-compatible endpoint on the
+    shared pool and returns the message content. Skips the SDK's request/response
+    models, which matter when the payload carries base64 images.
+    Rate limits (429) and 5xx are retried with backoff; other errors raise at once.
+    """
+    body = orjson.dumps(payload)
+    headers = {
+        "Authorization": f"Bearer {os.getenv('GROQ_API_KEY')}",
+        "Content-Type": "application/json"
+    }
+    for attempt in range(max_retries):
+        # Bounded in-flight requests: past the limit, sessions queue here instead of piling 429s on Groq
+        with _groq_slots:
+            response = get_http_client().post(GROQ_CHAT_URL, headers=headers, content=body)
+        if response.status_code != 429 and response.status_code < 500:
+            break
+        if attempt < max_retries - 1:
+            wait = _retry_delay(response, attempt)
+            print(f"Groq API {response.status_code}. Retrying in {wait:.1f}s...")
+            time.sleep(wait)
+
+    if response.is_error:
+        raise RuntimeError(f"Groq API {response.status_code}: {response.text}")
+    return orjson.loads(response.content)["choices"][0]["message"]["content"]
+
+@lru_cache(maxsize=None)
+def get_pinecone_index():
+    print("Connecting to Pinecone...")
+    pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
+    return pc.Index(PINECONE_INDEX_NAME)
+
+@lru_cache(maxsize=None)
+def configure_gemini() -> None:
+    print("Connecting to Gemini Embeddings...")
+    genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
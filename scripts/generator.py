@@ -1,33 +1,18 @@
-import os
-from typing import List, Dict
-from groq import Groq
+from typing import List, Dict, Optional
+from scripts.clients import get_groq_client
 from dotenv import load_dotenv
 
 load_dotenv()
 
-client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+# --- CONFIGURATION ---
+FAST_MODEL_ID = "llama-3.1-8b-instant"
+QUALITY_MODEL_ID = "llama-3.3-70b-versatile"
+# Above this temperature the draft is routed to the larger model
+QUALITY_TEMPERATURE_THRESHOLD = 0.7
 
-def generate_poem(vision_narrative: str, reference_poems: List[Dict],temperature: float = 0.6) -> str:
-    """
-    Inputs:
-        vision_narrative: The description of what the camera saw.
-        reference_poems: The Top 3 poems retrieved from the DB.
-    Output:
-        A new, original poem in the style of Emily Dickinson.
-    """
-    
-
-    reference_text = ""
-    for i, item in enumerate(reference_poems):
-        meta = item['metadata']
-        text = meta.get('text', '')
-
-        reference_text += f"\n--- Reference {i+1} ---\n{text}\n"
-
-    print(f"Ghost Writer initialized with {len(reference_poems)} references.")
-
-    #System Prompt
-    system_prompt = """
+# System Prompt: a module constant, so every request starts with a byte-identical prefix
+# (lets Groq's server-side prefix cache hit across calls)
+SYSTEM_PROMPT = """
     You are the ghost of Emily Dickinson. 
     You do not speak like a modern assistant. You speak only in poetry.
     
@@ -42,25 +27,50 @@ def generate_poem(vision_narrative: str, reference_poems: List[Dict],temperature
     6. Do not output any intro text (like "Here is a poem"). Just the poem.
     """
 
-    #The User Prompt
-    user_prompt = f"""
-    SCENE OBSERVED:
-    {vision_narrative}
+def generate_poem(
+    vision_narrative: str,
+    reference_poems: List[Dict],
+    temperature: float = 0.6,
+    model: Optional[str] = None
+) -> str:
+    """
+    Inputs:
+        vision_narrative: The description of what the camera saw.
+        reference_poems: The Top 3 poems retrieved from the DB.
+        model: Groq model ID. Defaults to the 8B model, or the 70B model
+            when temperature > QUALITY_TEMPERATURE_THRESHOLD.
+    Output:
+        A new, original poem in the style of Emily Dickinson.
+    """
+    if model is None:
+        model = QUALITY_MODEL_ID if temperature > QUALITY_TEMPERATURE_THRESHOLD else FAST_MODEL_ID
+
+    reference_text = "".join(
+        f"\n--- Reference {i+1} ---\n{item['metadata'].get('text', '')}\n"
+        for i, item in enumerate(reference_poems)
+    )
 
+    print(f"Ghost Writer initialized with {len(reference_poems)} references ({model}).")
+
+    #The User Prompt (the per-image narrative goes LAST to keep the shared prefix long)
+    user_prompt = f"""
     STYLE REFERENCES:
     {reference_text}
 
+    SCENE OBSERVED:
+    {vision_narrative}
+
     Write the poem now:
     """
 
     #The Generation
     try:
-        chat_completion = client.chat.completions.create(
+        chat_completion = get_groq_client().chat.completions.create(
             messages=[
-                {"role": "system", "content": system_prompt},
+                {"role": "system", "content": SYSTEM_PROMPT},
                 {"role": "user", "content": user_prompt}
             ],
-            model="llama-3.3-70b-versatile",
+            model=model,
             temperature=temperature,
             max_tokens=200,
         )
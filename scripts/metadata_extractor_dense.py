@@ -1,6 +1,10 @@
 import os
 import json
 import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 from groq import Groq
 from dotenv import load_dotenv
 
@@ -13,7 +17,14 @@ client = Groq(api_key=GROQ_API_KEY)
 MODEL_NAME = "llama-3.3-70b-versatile"
 
 INPUT_FILE = "data/dickinson_clean.txt"
+POEM_SEPARATOR = "---POEM_SEPARATOR---"
 OUTPUT_FILE = "data/dickinson_metadata_dense.json"
+# Append-only progress log (one entry per line); OUTPUT_FILE is rebuilt from it at the end
+PROGRESS_FILE = "data/dickinson_metadata_dense.jsonl"
+
+# Concurrency: network-bound calls, so threads; the limiter keeps us under Groq's RPM
+MAX_WORKERS = 8
+REQUESTS_PER_MINUTE = 30
 
 def get_dense_tags(poem_text):
     """
@@ -55,80 +66,148 @@ def get_dense_tags(poem_text):
         print(f"Error extracting tags: {e}")
         return None
 
+def iter_poems(path, separator=POEM_SEPARATOR):
+    """Yields poems one at a time from the clean corpus instead of read() + split()."""
+    buf = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.rstrip("\n") == separator:
+                yield "".join(buf)
+                buf = []
+            else:
+                buf.append(line)
+    yield "".join(buf)
+
+def map_in_order(executor, fn, items, window):
+    """
+    Like executor.map, but only keeps 'window' tasks in flight, so the poem
+    stream is pulled lazily instead of being submitted all at once.
+    """
+    in_flight = deque()
+    for item in items:
+        in_flight.append(executor.submit(fn, item))
+        if len(in_flight) >= window:
+            yield in_flight.popleft().result()
+    while in_flight:
+        yield in_flight.popleft().result()
+
 def load_existing_data():
-    """Loads progress so we can resume if crashed."""
-    if os.path.exists(OUTPUT_FILE):
-        try:
-            with open(OUTPUT_FILE, "r", encoding="utf-8") as f:
-                content = f.read().strip()
-                if content:
-                    return json.loads(content)
-        except json.JSONDecodeError:
-            print("JSON file corrupted or empty. Starting fresh.")
-            return []
-    return []
+    """
+    Loads progress so we can resume if crashed.
+    Reads the JSONL log; a half-written last line (crash mid-append) is dropped.
+    Falls back to a previous run's JSON array so old progress is not lost.
+    """
+    if not os.path.exists(PROGRESS_FILE):
+        if os.path.exists(OUTPUT_FILE):
+            try:
+                with open(OUTPUT_FILE, "r", encoding="utf-8") as f:
+                    content = f.read().strip()
+                    existing = json.loads(content) if content else []
+            except json.JSONDecodeError:
+                print("JSON file corrupted or empty. Starting fresh.")
+                existing = []
+            rewrite_progress(existing)
+            return existing
+        return []
+
+    entries = []
+    with open(PROGRESS_FILE, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                print("Progress log ends in a partial line. Truncating it.")
+                rewrite_progress(entries)
+                break
+    return entries
+
+def rewrite_progress(entries):
+    with open(PROGRESS_FILE, "w", encoding="utf-8") as f:
+        for entry in entries:
+            f.write(json.dumps(entry) + "\n")
+
+def finalize_output(entries):
+    """Writes the indented JSON array that vector_loader.py reads."""
+    with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
+        json.dump(entries, f, indent=2)
+
+class RateLimiter:
+    """Spaces request starts evenly so the worker pool stays under Groq's RPM."""
+
+    def __init__(self, requests_per_minute: int):
+        self.interval = 60.0 / requests_per_minute
+        self.next_slot = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(self.next_slot, now)
+            self.next_slot = slot + self.interval
+        time.sleep(max(0.0, slot - now))
+
+rate_limiter = RateLimiter(REQUESTS_PER_MINUTE)
+
+def process_poem(i, poem):
+    """Returns the entry for poem #i, or None if tagging failed."""
+    poem = poem.strip()
+
+    # --- PROSE FILTER ---
+    lines = poem.split('\n')
+    if len(lines) > 0:
+        avg_line_len = sum(len(line) for line in lines) / len(lines)
+    else:
+        avg_line_len = 0
+
+    # Filter Condition
+    if len(poem) < 10 or avg_line_len > 65:
+        print(f"  Skipping Poem #{i+1} (Prose/Note detected)")
+        return {"id": f"poem_{i:04d}", "status": "skipped"}
+
+    rate_limiter.wait()
+    print(f"Thinking about Poem #{i+1}...")
+    
+    tags = get_dense_tags(poem)
+    if not tags:
+        return None
+
+    return {
+        "id": f"poem_{i:04d}",
+        "text": poem,
+        "metadata": tags 
+    }
 
 def main():
     if not os.path.exists(INPUT_FILE):
         print(f"Could not find {INPUT_FILE}. Run ingestion script first.")
         return
 
-    # 1. Load Raw Poems
-    print("Loading poems...")
-    with open(INPUT_FILE, "r", encoding="utf-8") as f:
-        raw_data = f.read()
-        all_poems = raw_data.split("\n---POEM_SEPARATOR---\n")
-
-    # 2. Check Progress
+    # 1. Check Progress
     processed_data = load_existing_data()
     start_index = len(processed_data)
     
     print(f"Found {start_index} poems already processed.")
-    print(f"Starting Deep Analysis on remaining {len(all_poems) - start_index} poems using {MODEL_NAME}...")
+    print(f"Starting Deep Analysis on remaining poems using {MODEL_NAME}...")
+
+    # 2. Stream Raw Poems, skipping the already-processed ones without keeping them
+    pending = islice(enumerate(iter_poems(INPUT_FILE)), start_index, None)
+
+    # 3. Processing Loop (bounded pool; results are consumed in poem order so resume-by-count stays valid)
+    # Each entry is appended as one JSON line: O(1) per poem instead of rewriting the whole file
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor, \
+            open(PROGRESS_FILE, "a", encoding="utf-8") as progress:
+        results = map_in_order(executor, lambda item: process_poem(*item), pending, MAX_WORKERS * 2)
+        for entry in results:
+            if entry is None:
+                print("Failed to tag. Saving progress and stopping.")
+                executor.shutdown(wait=False, cancel_futures=True)
+                break
 
-    # 3. Processing Loop
-    for i in range(start_index, len(all_poems)):
-        poem = all_poems[i].strip()
-        
-        # --- PROSE FILTER ---
-        lines = poem.split('\n')
-        if len(lines) > 0:
-            avg_line_len = sum(len(line) for line in lines) / len(lines)
-        else:
-            avg_line_len = 0
-
-        # Filter Condition
-        if len(poem) < 10 or avg_line_len > 65:
-            print(f"  Skipping Poem #{i+1} (Prose/Note detected)")
-            
-            entry = {"id": f"poem_{i:04d}", "status": "skipped"}
-            processed_data.append(entry)
-            
-            with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
-                json.dump(processed_data, f, indent=2)
-            continue
-
-        print(f"Thinking about Poem #{i+1}...")
-        
-        tags = get_dense_tags(poem)
-        
-        if tags:
-            entry = {
-                "id": f"poem_{i:04d}",
-                "text": poem,
-                "metadata": tags 
-            }
             processed_data.append(entry)
-            
-            with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
-                json.dump(processed_data, f, indent=2)
-            
-  
-            time.sleep(0.5)
-        else:
-            print("Failed to tag. Saving progress and stopping.")
-            break
+            progress.write(json.dumps(entry) + "\n")
+            progress.flush()
 
+    finalize_output(processed_data)
     print(f"Script finished. Total database size: {len(processed_data)}")
 
 if __name__ == "__main__":
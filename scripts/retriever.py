@@ -1,66 +1,126 @@
-import os
-from typing import List, Dict, Any
-from dotenv import load_dotenv
-from pinecone import Pinecone
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
 import google.generativeai as genai
 
-load_dotenv()
+from scripts.clients import configure_gemini, get_pinecone_index
 
-# Configuration
-PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
-PINECONE_INDEX_NAME = "poetic-camera"
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+# Fixed query that samples the background "Universe" for the latent-space plot
+UNIVERSE_QUERY = "Life Death Eternity Nature Soul Love Time"
+UNIVERSE_TOP_K = 50
 
-# Initialize Systems
-print("Connecting to Pinecone...")
-pc = Pinecone(api_key=PINECONE_API_KEY)
-index = pc.Index(PINECONE_INDEX_NAME)
+EMBEDDING_CACHE_SIZE = 512
+_embedding_cache: "OrderedDict[str, List[float]]" = OrderedDict()
+_cache_lock = threading.Lock()
 
-print("Connecting to Gemini Embeddings...")
-genai.configure(api_key=GEMINI_API_KEY)
+def _cache_key(text: str) -> str:
+    # Whitespace-insensitive, so trivially different narratives share an entry
+    return " ".join(text.split())
 
 def get_embedding(text: str) -> List[float]:
     """Generates embedding using Gemini to match your database schema."""
-    try:
-        result = genai.embed_content(
-            model="models/text-embedding-004",
-            content=text,
-            task_type="retrieval_query" 
-        )
-        return result['embedding']
-    except Exception as e:
-        print(f"Embedding Error: {e}")
-        return []
+    vectors = get_embeddings([text])
+    return vectors[0] if vectors else []
 
-def retrieve_poems(query_narrative: str, top_k=3) -> List[Dict[str, Any]]:
+def get_embeddings(texts: List[str]) -> List[List[float]]:
     """
-    Pure Vector Search. Fast and efficient.
+    Embeds several texts in a single Gemini request.
+    Process-wide LRU: texts embedded before (by any session) skip the network call.
     """
-    print(f"\nSearching Pinecone for: '{query_narrative}'")
+    keys = [_cache_key(t) for t in texts]
+    found: Dict[str, List[float]] = {}
+    with _cache_lock:
+        for key in keys:
+            if key in _embedding_cache:
+                _embedding_cache.move_to_end(key)
+                found[key] = _embedding_cache[key]
+    misses = [key for key in dict.fromkeys(keys) if key not in found]
 
-    vector = get_embedding(query_narrative)
-    if not vector:
-        return []
-    
+    if misses:
+        try:
+            configure_gemini()
+            result = genai.embed_content(
+                model="models/text-embedding-004",
+                content=misses,
+                task_type="retrieval_query"
+            )
+        except Exception as e:
+            print(f"Embedding Error: {e}")
+            return []
+
+        found.update(zip(misses, result['embedding']))
+        with _cache_lock:
+            for key in misses:
+                _embedding_cache[key] = found[key]
+            while len(_embedding_cache) > EMBEDDING_CACHE_SIZE:
+                _embedding_cache.popitem(last=False)
+
+    return [found[key] for key in keys]
+
+def _query_index(vector: List[float], top_k: int, include_values: bool = False) -> List[Dict[str, Any]]:
     try:
-        results = index.query(
+        results = get_pinecone_index().query(
             vector=vector,
             top_k=top_k,
             include_metadata=True,
-            include_values=True
+            include_values=include_values
         )
     except Exception as e:
         print(f"Pinecone Error: {e}")
         return []
+    return results['matches']
+
+def retrieve_poems_batch(
+    queries: List[str],
+    top_k: Optional[List[int]] = None
+) -> List[Tuple[List[float], List[Dict[str, Any]]]]:
+    """
+    Batched Vector Search. One embedding call for all queries, then the
+    Pinecone queries are issued concurrently (the index takes one vector per query).
+    Returns a (query_vector, matches) pair per query, in input order.
+    """
+    if top_k is None:
+        top_k = [3] * len(queries)
+
+    print(f"\nBatch searching Pinecone for {len(queries)} queries...")
+
+    vectors = get_embeddings(queries)
+    if len(vectors) != len(queries):
+        return [([], []) for _ in queries]
+
+    with ThreadPoolExecutor(max_workers=len(queries)) as pool:
+        matches = list(pool.map(retrieve_poems, queries, top_k, vectors))
+
+    return list(zip(vectors, matches))
+
+def retrieve_poems(
+    query_narrative: str,
+    top_k=3,
+    vector: Optional[List[float]] = None,
+    include_values: bool = False
+) -> List[Dict[str, Any]]:
+    """
+    Pure Vector Search. Fast and efficient.
+    Pass a precomputed 'vector' to skip the embedding call.
+    Match vectors are only returned with include_values=True (they are ~3KB each).
+    """
+    print(f"\nSearching Pinecone for: '{query_narrative}'")
+
+    if vector is None:
+        vector = get_embedding(query_narrative)
+    if not vector:
+        return []
     
-    if not results['matches']:
+    matches = _query_index(vector, top_k, include_values)
+    if not matches:
         print("No matches found.")
         return []
 
     found_poems = []
-    print(f"Found {len(results['matches'])} matches.")
+    print(f"Found {len(matches)} matches.")
     
-    for match in results['matches']:
+    for match in matches:
         found_poems.append(match)
         title = match['metadata'].get('title', 'Unknown')
         score = match['score']
@@ -68,6 +128,28 @@ def retrieve_poems(query_narrative: str, top_k=3) -> List[Dict[str, Any]]:
         
     return found_poems
 
+def warm_up() -> None:
+    """Tiny probe so the first real request finds the Gemini and Pinecone channels open."""
+    try:
+        get_embedding("warmup")
+        get_pinecone_index().describe_index_stats()
+    except Exception as e:
+        print(f"Warm-up Error: {e}")
+
+def fetch_universe_vectors() -> List[List[float]]:
+    """Raw vectors of the background Universe (one Pinecone query)."""
+    results = retrieve_poems(UNIVERSE_QUERY, top_k=UNIVERSE_TOP_K, include_values=True)
+    return [item['values'] for item in results if 'values' in item]
+
+def fetch_vectors(ids: List[str]) -> Dict[str, List[float]]:
+    """Looks up stored vectors by id (only needed when the latent-space plot is shown)."""
+    try:
+        response = get_pinecone_index().fetch(ids=ids)
+    except Exception as e:
+        print(f"Pinecone Error: {e}")
+        return {}
+    return {vec_id: vec.values for vec_id, vec in response.vectors.items()}
+
 if __name__ == "__main__":
     # Test
     retrieve_poems("A Serene poem about Nature and Solitude.")
\ No newline at end of file
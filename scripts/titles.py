@@ -0,0 +1,9 @@
+import re
+
+# Title cleanup: one regex pass + one translate instead of lower/replace/title chains
+POEM_POEM_RE = re.compile(r"poem poem", re.IGNORECASE)
+UNDERSCORE_TO_SPACE = str.maketrans("_", " ")
+
+def clean_title(raw_title: str) -> str:
+    """'Poem poem_0042' -> 'Poem 0042' (the display form shown in the app)."""
+    return POEM_POEM_RE.sub("Poem", raw_title).translate(UNDERSCORE_TO_SPACE).title()
@@ -0,0 +1,56 @@
+import hashlib
+import os
+from typing import Dict, Optional
+
+import numpy as np
+
+from scripts.retriever import UNIVERSE_QUERY, UNIVERSE_TOP_K, fetch_universe_vectors
+from scripts.visualizer import fit_universe_projection
+
+# The Universe never changes, so its PCA is fitted once and reused from disk.
+# Refresh after re-indexing Pinecone: python -m scripts.universe_projection
+PROJECTION_FILE = "cache/universe_pca.npz"
+
+# The raw vectors are kept too (keyed by the query that sampled them), so refitting
+# the projection never needs Pinecone. Loaded memory-mapped: rows page in from the OS cache.
+_universe_key = hashlib.sha1(f"{UNIVERSE_QUERY}|{UNIVERSE_TOP_K}".encode()).hexdigest()[:12]
+VECTORS_FILE = f"cache/universe_vectors_{_universe_key}.npy"
+
+def load_universe_vectors(path: str = VECTORS_FILE, refresh: bool = False) -> np.ndarray:
+    """Universe vectors from disk, fetched from Pinecone (and saved) on a miss or refresh."""
+    if not refresh and os.path.exists(path):
+        return np.load(path, mmap_mode='r')
+
+    vectors = np.asarray(fetch_universe_vectors(), dtype=np.float32)
+    if len(vectors):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        np.save(path, vectors)
+    return vectors
+
+def load_projection(path: str = PROJECTION_FILE) -> Optional[Dict[str, np.ndarray]]:
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        return {key: data[key] for key in data.files}
+
+def build_projection(path: str = PROJECTION_FILE, refresh: bool = False) -> Optional[Dict[str, np.ndarray]]:
+    """Fits the projection on the Universe (from Pinecone if refresh or not cached) and saves it."""
+    vectors = load_universe_vectors(refresh=refresh)
+    if len(vectors) < 3:
+        print("[ERROR] Not enough Universe vectors to fit a 3D projection.")
+        return None
+
+    projection = fit_universe_projection(vectors)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    np.savez(path, **projection)
+    print(f"[SYSTEM] Saved Universe projection ({len(vectors)} points) to {path}")
+    return projection
+
+def load_or_build_projection(path: str = PROJECTION_FILE) -> Optional[Dict[str, np.ndarray]]:
+    projection = load_projection(path)
+    if projection is None:
+        projection = build_projection(path)
+    return projection
+
+if __name__ == "__main__":
+    build_projection(refresh=True)
@@ -1,11 +1,15 @@
 import json
 import os
 import time
-from typing import List, Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional
 
 from dotenv import load_dotenv
-from pinecone import Pinecone 
+from pinecone.grpc import PineconeGRPC as Pinecone
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
+
+from scripts.titles import clean_title
 
 
 load_dotenv() 
@@ -44,6 +48,29 @@ def build_semantic_string(poem_obj: Dict[str, Any]) -> str:
     return narrative
 
 
+def embed_batch(texts: List[str], max_retries: int = 5) -> Optional[List[List[float]]]:
+    """
+    Embeds a whole batch in one Gemini request.
+    Rate limits (429) are retried with exponential backoff; other errors give up.
+    """
+    for attempt in range(max_retries):
+        try:
+            response = genai.embed_content(
+                model="models/text-embedding-004",
+                content=texts,
+                task_type="retrieval_document" 
+            )
+            return response['embedding']
+        except google_exceptions.ResourceExhausted as e:
+            wait = 2 ** attempt
+            print(f"Rate limited ({e}). Retrying in {wait}s...")
+            time.sleep(wait)
+        except Exception as e:
+            print(f"Embedding Error: {e}")
+            return None
+    return None
+
+
 def load_data():
     try:
         with open("data/dickinson_metadata_dense.json", "r") as f:
@@ -54,50 +81,49 @@ def load_data():
         return
 
     batch_size = 50
-    vectors_to_upsert = []
+    pending_upserts = []
+    # Upserts run on a small pool so the next batch's embedding overlaps them
+    # (a thread pool rather than async_req, which newer Pinecone SDKs dropped)
+    upsert_pool = ThreadPoolExecutor(max_workers=4)
     
     print("Starting Batch Processing...")
 
-    for i, poem in enumerate(poems):
-        # Create the Semantic String
-        semantic_text = build_semantic_string(poem)
+    for start in range(0, len(poems), batch_size):
+        batch = poems[start:start + batch_size]
+
+        # Create the Semantic Strings
+        semantic_texts = [build_semantic_string(poem) for poem in batch]
         
-        # B. Generate Embedding (The "Translation" to Math)
+        # B. Generate Embeddings (The "Translation" to Math) — one request per batch
         # We use 'task_type="retrieval_document"' because this data is being stored for searching
-        try:
-            response = genai.embed_content(
-                model="models/text-embedding-004",
-                content=semantic_text,
-                task_type="retrieval_document" 
-            )
-            embedding = response['embedding']
-        except Exception as e:
-            print(f"Error embedding poem {poem.get('id', 'unknown')}: {e}")
+        embeddings = embed_batch(semantic_texts)
+        if embeddings is None:
+            print(f"Error embedding batch starting at poem {batch[0].get('id', 'unknown')}. Skipping batch.")
             continue
 
         # Prepare Pinecone Payload
         # We store the 'text' in metadata so we can print it later without querying a separate DB
-        vector_payload = {
-            "id": poem.get("id"), 
-            "values": embedding,
-            "metadata": {
-                "text": poem.get("text"),
-                "title": f"Poem {poem.get('id')}",
-                "semantic_string": semantic_text # Good for debugging later
-            }
-        }
-        vectors_to_upsert.append(vector_payload)
-
-        # D. Upsert when Batch is Full
-        if len(vectors_to_upsert) >= batch_size:
-            index.upsert(vectors=vectors_to_upsert)
-            print(f"Upserted batch {i+1}/{len(poems)}")
-            vectors_to_upsert = [] # Reset batch
-
-    # Final Upsert (for any leftovers)
-    if vectors_to_upsert:
-        index.upsert(vectors=vectors_to_upsert)
-        print(f"Upserted final batch. Total processed.")
+        vectors_to_upsert = []
+        for poem, semantic_text, embedding in zip(batch, semantic_texts, embeddings):
+            vectors_to_upsert.append({
+                "id": poem.get("id"), 
+                "values": embedding,
+                "metadata": {
+                    "text": poem.get("text"),
+                    "title": f"Poem {poem.get('id')}",
+                    "display_title": clean_title(f"Poem {poem.get('id')}"),
+                    "semantic_string": semantic_text # Good for debugging later
+                }
+            })
+
+        # D. Upsert the full Batch without waiting, so the next batch's embedding overlaps it
+        pending_upserts.append((start + len(batch), upsert_pool.submit(index.upsert, vectors=vectors_to_upsert)))
+
+    for done, future in pending_upserts:
+        future.result()
+        print(f"Upserted batch {done}/{len(poems)}")
+    upsert_pool.shutdown()
 
 if __name__ == "__main__":
+    # Run from the repo root: python -m scripts.vector_loader
     load_data()
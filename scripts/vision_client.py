@@ -1,19 +1,250 @@
 import os
-import json
 import base64
 import io
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+from typing import Any, Dict, Final, List, Optional, Tuple
+import numpy as np
+import orjson
 from dotenv import load_dotenv
-from groq import Groq
+from scripts.clients import groq_chat
 from PIL import Image
 
+# Optional: libvips for fused decode+resize (falls back to PIL if not installed)
+try:
+    import pyvips
+    VIPS_AVAILABLE = True
+except (ImportError, OSError):
+    VIPS_AVAILABLE = False
+
+# Optional: libjpeg-turbo's SIMD encoder for the PIL path (falls back to img.save)
+try:
+    from turbojpeg import TurboJPEG, TJPF_RGB, TJSAMP_420, TJFLAG_FASTDCT
+    TURBOJPEG_AVAILABLE = True
+except ImportError:
+    TURBOJPEG_AVAILABLE = False
+
+# Optional: SIMD base64 (falls back to the stdlib encoder)
+try:
+    import pybase64
+    PYBASE64_AVAILABLE = True
+except ImportError:
+    PYBASE64_AVAILABLE = False
+
 load_dotenv()
 
 # --- CONFIGURATION ---
 # Engineering Tip: Define model IDs as constants at the top or in .env
 # This makes future updates a 1-line change.
 VISION_MODEL_ID = "meta-llama/llama-4-scout-17b-16e-instruct" 
+# Longest side sent to the model (optimizes token usage and latency)
+THUMBNAIL_SIZE = 512
+# The model only needs the gist; Q78 is a smaller payload than Q85 with no visible loss at 512px
+JPEG_QUALITY = 78
+# Modes sent to the encoder as-is; CMYK is converted since many decoders mishandle CMYK JPEGs
+JPEG_NATIVE_MODES = ('RGB', 'L')
+
+# Set VISION_UPLOAD_BUCKET to send the model a short-lived URL instead of base64 bytes.
+# Each photo is deleted once the model has answered; a failed delete is only logged, so
+# give the bucket a lifecycle rule expiring the vision/ prefix after a day as a backstop.
+UPLOAD_BUCKET = os.getenv("VISION_UPLOAD_BUCKET")
+UPLOAD_PREFIX = "vision/"
+UPLOAD_URL_TTL = 300  # seconds; only needs to outlive the Groq call
+
+# Dynamic batching: images from concurrent sessions that arrive within MAX_WAIT
+# share one multi-image request (Groq accepts up to 5 images per call)
+MAX_BATCH = 5
+MAX_WAIT = 0.05  # seconds
+
+# Every instruction lives in one frozen system prompt: byte-identical on every request
+# (no interpolation, single or batched), so Groq can reuse the cached prefix.
+# The user turn carries only the images.
+SYSTEM_PROMPT: Final[str] = """You are a poetic assistant. Return ONLY valid JSON.
+
+You are given one or more images. Analyze each one, in order, for a 19th-century poem. Identify:
+1. Mood: Single adjective.
+2. Themes: 2-3 abstract concepts.
+3. Concrete Nouns: 3-5 physical objects.
+
+Return strictly this JSON, with one object in "images" per image, in order:
+{
+    "images": [
+        {
+            "mood": "str",
+            "themes": ["str", "str"],
+            "concrete_nouns": ["str", "str"]
+        }
+    ]
+}"""
 
-client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+
+# Heavy optional clients are created on first use, not at import, so Streamlit
+# (re)loads of this module stay cheap and unused features cost nothing.
+@lru_cache(maxsize=None)
+def get_turbojpeg() -> Optional["TurboJPEG"]:
+    # Loads libturbojpeg; None if the shared library is missing
+    try:
+        return TurboJPEG()
+    except (OSError, RuntimeError) as e:
+        print(f"[WARN] TurboJPEG unavailable, using PIL encoder: {e}")
+        return None
+
+@lru_cache(maxsize=None)
+def get_s3_client():
+    # Optional dependency for the presigned-URL upload; boto3 is slow to import
+    # and only needed when VISION_UPLOAD_BUCKET is set
+    import boto3
+    return boto3.client("s3")
+
+def prepare_jpeg(raw: bytes) -> bytes:
+    """
+    Downscales the upload to fit THUMBNAIL_SIZE and re-encodes it as JPEG.
+    libvips fuses JPEG shrink-on-load with the resize, so large camera shots are never
+    fully decoded; PIL (draft + thumbnail) is the fallback.
+    """
+    if VIPS_AVAILABLE:
+        # thumbnail resizes with lanczos3 and applies EXIF orientation; strip drops the metadata
+        thumb = pyvips.Image.thumbnail_buffer(raw, THUMBNAIL_SIZE, height=THUMBNAIL_SIZE, size='down')
+        return thumb.write_to_buffer(f'.jpg[Q={JPEG_QUALITY},optimize_coding=true,strip=true,interlace=false]')
+
+    with Image.open(io.BytesIO(raw)) as img:
+        # JPEG shrink-on-load: let the decoder skip pixels we are about to throw away
+        img.draft('RGB', (THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        # RGB and grayscale go straight to the encoder; CMYK, alpha, palette and high-bit modes need a pass
+        if img.mode not in JPEG_NATIVE_MODES:
+            img = img.convert('RGB')
+        
+        # Resize to optimize token usage and latency
+        img.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE), Image.Resampling.LANCZOS)
+        
+        turbo = get_turbojpeg() if TURBOJPEG_AVAILABLE else None
+        if turbo is not None and img.mode == 'RGB':
+            # TurboJPEG defaults to BGR input; PIL hands us RGB
+            return turbo.encode(
+                np.asarray(img), quality=JPEG_QUALITY, pixel_format=TJPF_RGB,
+                jpeg_subsample=TJSAMP_420, flags=TJFLAG_FASTDCT
+            )
+
+        buffered = io.BytesIO()
+        # No exif= argument, so nothing from the upload's metadata is written back
+        img.save(buffered, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+        return buffered.getvalue()
+
+def upload_to_presigned(jpeg_bytes: bytes) -> Optional[Tuple[str, str]]:
+    """
+    Uploads the JPEG and returns (presigned GET URL, object key), or None when no
+    bucket is configured or the upload fails (the caller then inlines a data URL).
+    """
+    if not UPLOAD_BUCKET:
+        return None
+    try:
+        s3 = get_s3_client()
+        # Unique per call, so concurrent uploads of the same photo never delete each other's object
+        object_key = f"{UPLOAD_PREFIX}{uuid.uuid4().hex}.jpg"
+        s3.put_object(Bucket=UPLOAD_BUCKET, Key=object_key, Body=jpeg_bytes, ContentType="image/jpeg")
+        url = s3.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": UPLOAD_BUCKET, "Key": object_key},
+            ExpiresIn=UPLOAD_URL_TTL
+        )
+        return url, object_key
+    except Exception as e:
+        print(f"[WARN] Image upload failed, sending inline: {e}")
+        return None
+
+def delete_upload(object_key: str) -> None:
+    try:
+        get_s3_client().delete_object(Bucket=UPLOAD_BUCKET, Key=object_key)
+    except Exception as e:
+        print(f"[WARN] Could not delete uploaded image {object_key}: {e}")
+
+def describe_images(image_urls: List[str]) -> List[Dict[str, Any]]:
+    """
+    One chat completion for one or more images. Returns the parsed JSON object
+    for each image, in order.
+    """
+    content = [{"type": "image_url", "image_url": {"url": url}} for url in image_urls]
+
+    reply = groq_chat({
+        "model": VISION_MODEL_ID,
+        "messages": [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": content}
+        ],
+        "response_format": {"type": "json_object"},
+        "temperature": 0.5,
+    })
+    result = orjson.loads(reply)
+    results = result.get('images', [])
+    if len(image_urls) == 1:
+        # Tolerate a bare object for a single image
+        return results[:1] or [result]
+
+    if len(results) != len(image_urls):
+        # The model lost count; answer each image on its own rather than misattribute
+        print(f"[WARN] Batch of {len(image_urls)} returned {len(results)} results, retrying singly")
+        return [describe_images([url])[0] for url in image_urls]
+    return results
+
+class VisionBatcher:
+    """
+    Coalesces concurrent analyze_image calls. Callers get a Future; a daemon thread
+    flushes the queue when MAX_BATCH images are waiting or MAX_WAIT has passed since
+    the first arrival, and hands the batch to a pool so collection never stalls.
+    """
+    def __init__(self, max_batch: int = MAX_BATCH, max_wait: float = MAX_WAIT):
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="vision-batch")
+
+    def submit(self, image_url: str) -> Future:
+        future = Future()
+        with self._cond:
+            self._pending.append((image_url, future))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._collect, daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return future
+
+    def _collect(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                deadline = time.monotonic() + self.max_wait
+                while len(self._pending) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = [self._pending.popleft() for _ in range(min(self.max_batch, len(self._pending)))]
+            self._pool.submit(self._flush, batch)
+
+    def _flush(self, batch) -> None:
+        try:
+            results = describe_images([url for url, _ in batch])
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0][1].set_exception(e)
+                return
+            # One bad image shouldn't fail its neighbours: answer each on its own,
+            # so only the image whose single call fails gets the error
+            print(f"[WARN] Batch of {len(batch)} failed ({e}), retrying singly")
+            for item in batch:
+                self._flush([item])
+            return
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+_batcher = VisionBatcher()
 
 def analyze_image(image_file) -> str:
     """
@@ -28,70 +259,35 @@ def analyze_image(image_file) -> str:
     
     try:
         # 1. Load and Resize
-        with Image.open(image_file) as img:
-            if img.mode != 'RGB':
-                img = img.convert('RGB')
+        jpeg_bytes = prepare_jpeg(image_file.read())
             
-            # Resize to optimize token usage and latency
-            img.thumbnail((512, 512))
-            
-            # 2. Convert to Base64
-            buffered = io.BytesIO()
-            img.save(buffered, format="JPEG")
-            base64_image = base64.b64encode(buffered.getvalue()).decode('utf-8')
-
-        # 3. The Prompt
-        system_prompt = "You are a poetic assistant. Return ONLY valid JSON."
-        user_prompt = """
-        Analyze this image for a 19th-century poem. Identify:
-        1. Mood: Single adjective.
-        2. Themes: 2-3 abstract concepts.
-        3. Concrete Nouns: 3-5 physical objects.
-
-        Return strictly this JSON:
-        {
-            "mood": "str",
-            "themes": ["str", "str"],
-            "concrete_nouns": ["str", "str"]
-        }
-        """
-
-        # 4. API Call
-        response = client.chat.completions.create(
-            model=VISION_MODEL_ID, # <--- Updated Reference
-            messages=[
-                {
-                    "role": "system",
-                    "content": system_prompt
-                },
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text", 
-                            "text": user_prompt
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}"
-                            }
-                        }
-                    ]
-                }
-            ],
-            response_format={"type": "json_object"},
-            temperature=0.5,
-        )
-        
-        # 5. Parse
-        result = json.loads(response.choices[0].message.content)
+        # 2. Reference by URL when storage is configured, else inline as Base64
+        upload = upload_to_presigned(jpeg_bytes)
+        if upload is not None:
+            image_url, object_key = upload
+        else:
+            object_key = None
+            if PYBASE64_AVAILABLE:
+                base64_image = pybase64.b64encode_as_string(jpeg_bytes)
+            else:
+                base64_image = base64.b64encode(jpeg_bytes).decode('ascii')
+            image_url = f"data:image/jpeg;base64,{base64_image}"
+
+        # 3. API Call (batched with any concurrent requests)
+        try:
+            result = _batcher.submit(image_url).result()
+        finally:
+            # The model has fetched it (or failed); user photos don't outlive the call
+            if object_key is not None:
+                delete_upload(object_key)
         
-        # 6. Construct String
-        noun_str = ", ".join(result.get('concrete_nouns', []))
-        theme_str = ", ".join(result.get('themes', []))
-        mood_str = result.get('mood', 'Unknown')
+        # 4. Construct String
+        # `or` also covers explicit nulls from the model; an empty tuple allocates nothing
+        noun_str = ", ".join(result.get('concrete_nouns') or ())
+        theme_str = ", ".join(result.get('themes') or ())
+        mood_str = result.get('mood') or 'Unknown'
         
+        # An f-string compiles to a single BUILD_STRING, already the cheapest concatenation
         narrative = f"A {mood_str} poem about {theme_str}, featuring imagery of {noun_str}."
         
         print(f"[SUCCESS] Generated Query: '{narrative}'")
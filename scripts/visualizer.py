@@ -1,19 +1,69 @@
 import numpy as np
-import pandas as pd
-import plotly.express as px
+import plotly.graph_objects as go
 from sklearn.decomposition import PCA
 from sklearn.preprocessing import StandardScaler
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Union
+
+COLOR_MAP = {
+    "Universe": "#2c2f33",
+    "Memory": "#0068C9",
+    "Sensation": "#FF4B4B"
+}
+# Marker diameters in px (what px.scatter_3d's area scaling gave sizes 3/10/15)
+MARKER_SIZES = {"Universe": 9, "Memory": 16, "Sensation": 20}
+
+def fit_universe_projection(background_vectors: Union[np.ndarray, List[List[float]]]) -> Dict[str, np.ndarray]:
+    """
+    Fits Scaler + PCA on the Universe once and returns the pieces needed to
+    project new points: ((x - scale_mean) / scale - mean) @ components.T
+    """
+    X = np.asarray(background_vectors, dtype=np.float32)
+    scaler = StandardScaler().fit(X)
+    X_scaled = scaler.transform(X)
+    pca = PCA(n_components=3, svd_solver='randomized', random_state=0).fit(X_scaled)
+
+    return {
+        "scale_mean": scaler.mean_.astype(np.float32),
+        "scale": scaler.scale_.astype(np.float32),
+        "mean": pca.mean_.astype(np.float32),
+        "components": pca.components_.astype(np.float32),
+        "universe_3d": pca.transform(X_scaled).astype(np.float32),
+    }
 
 class LatentSpaceVisualizer:
-    def __init__(self, background_vectors: List[List[float]] = None):
+    def __init__(
+        self,
+        background_vectors: Union[np.ndarray, List[List[float]]] = None,
+        projection: Optional[Dict[str, np.ndarray]] = None
+    ):
         """
         Updated to accept 'background_vectors' passed from app.py.
+        The Universe is embedded once, from a precomputed 'projection' (see
+        fit_universe_projection) or by fitting it here; per call, only new points are projected.
         """
-        self.pca = PCA(n_components=3)
-        self.scaler = StandardScaler() 
+        # Randomized SVD only computes the 3 components we plot; the scaler
+        # works in place on the float32 block built per call
+        self.pca = PCA(n_components=3, svd_solver='randomized', random_state=0)
+        self.scaler = StandardScaler(copy=False)
         # We use the data passed from the app, or an empty list as fallback
-        self.background_vectors = background_vectors if background_vectors else []
+        # Held as one float32 (N, d) block, so fitting never re-coerces a list of lists
+        self.background_vectors = np.asarray(background_vectors if background_vectors is not None else [], dtype=np.float32)
+        self.projection = projection
+
+        if projection is None and len(self.background_vectors) >= 3:
+            # The Universe doesn't change between calls: fit Scaler + PCA on it once,
+            # so each plot only transforms the handful of new points.
+            # A 3D PCA needs at least 3 points; smaller Universes take the no-Universe path.
+            projection = self.projection = fit_universe_projection(self.background_vectors)
+
+        if projection is not None:
+            # Fold Scaler + PCA into one float32 affine map: x @ W.T - bias (a single BLAS gemm)
+            components = projection["components"]
+            self._w = (components / projection["scale"]).astype(np.float32)
+            self._bias = ((projection["scale_mean"] / projection["scale"] + projection["mean"]) @ components.T).astype(np.float32)
+
+    def _project(self, X: np.ndarray) -> np.ndarray:
+        return X @ self._w.T - self._bias
 
     def visualize_query_context(
         self, 
@@ -21,66 +71,58 @@ class LatentSpaceVisualizer:
         retrieved_items: List[Dict[str, Any]]
     ) -> Any:
         
-        vectors = []
-        labels = []
-        types = [] 
-        sizes = []
-
-        # Load Universe
-        for vec in self.background_vectors:
-            vectors.append(vec)
-            labels.append("Latent Background")
-            types.append("Universe")
-            sizes.append(3) 
+        # Load Universe (already embedded, see __init__)
+        universe_count = len(self.projection["universe_3d"]) if self.projection is not None else 0
 
         # Load Memories
-        for item in retrieved_items:
-            if 'values' in item:
-                vectors.append(item['values'])
-                meta = item.get('metadata', {})
-                labels.append(meta.get('title', 'Match'))
-                types.append("Memory")
-                sizes.append(10)
+        memories = [item for item in retrieved_items if 'values' in item]
+        memory_labels = [item.get('metadata', {}).get('title', 'Match') for item in memories]
 
-        # Load Sensation
-        vectors.append(query_vector)
-        labels.append("Your Vision")
-        types.append("Sensation")
-        sizes.append(15)
+        # Safety Check (Universe + Memories + Sensation)
+        if universe_count + len(memories) + 1 < 3: return None
 
         # --- MATH ENGINE ---
-        X = np.array(vectors)
-        
-        # Safety Check
-        if len(X) < 3: return None
+        # New points only, in one preallocated float32 block (no dtype inference or float64 copy)
+        X = np.empty((len(memories) + 1, len(query_vector)), dtype=np.float32)
+        for i, item in enumerate(memories):
+            X[i] = item['values']
+        X[-1] = query_vector
 
         # Normalize & Reduce
         try:
-            X_scaled = self.scaler.fit_transform(X)
-            X_embedded = self.pca.fit_transform(X_scaled)
+            if self.projection is not None:
+                # Universe was fitted offline: one small matmul for the new points only
+                X_embedded = np.concatenate([self.projection["universe_3d"], self._project(X)], axis=0)
+            else:
+                # No Universe at all: fit on the query context itself
+                X_scaled = self.scaler.fit_transform(X)
+                X_embedded = self.pca.fit_transform(X_scaled)
         except Exception as e:
             print(f"PCA Error: {e}")
             return None
 
         # --- PLOTTING ---
-        df = pd.DataFrame(X_embedded, columns=['x', 'y', 'z'])
-        df['Label'] = labels
-        df['Type'] = types
-        df['Size'] = sizes
+        # Rows are ordered Universe | Memories | Sensation, so each trace is a slice;
+        # building traces directly skips the DataFrame and Plotly Express' column handling
+        memory_end = universe_count + len(memories)
+        groups = [
+            ("Universe", slice(0, universe_count), ["Latent Background"] * universe_count),
+            ("Memory", slice(universe_count, memory_end), memory_labels),
+            ("Sensation", slice(memory_end, None), ["Your Vision"]),
+        ]
+        traces = [
+            go.Scatter3d(
+                x=X_embedded[rows, 0], y=X_embedded[rows, 1], z=X_embedded[rows, 2],
+                mode='markers', name=name, hovertext=hover, hoverinfo='text+name',
+                marker=dict(size=MARKER_SIZES[name], color=COLOR_MAP[name], opacity=0.8)
+            )
+            for name, rows, hover in groups if hover
+        ]
 
-        fig = px.scatter_3d(
-            df, x='x', y='y', z='z',
-            color='Type', size='Size', hover_name='Label',
-            title="Semantic Position (Normalized)",
-            color_discrete_map={
-                "Universe": "#2c2f33",
-                "Memory": "#0068C9",
-                "Sensation": "#FF4B4B"
-            },
-            opacity=0.8
-        )
-        
+        fig = go.Figure(data=traces)
         fig.update_layout(
+            title="Semantic Position (Normalized)",
+            legend_title_text="Type",
             margin=dict(l=0, r=0, b=0, t=30),
             scene=dict(xaxis=dict(visible=False), yaxis=dict(visible=False), zaxis=dict(visible=False))
         )